@@ -1,6 +1,6 @@
 # chunking.py
 # Purpose:
-# - take (file_path, content) from ingestion
+# - take (file_path, raw bytes) from ingestion
 # - produce chunks of text suitable for embedding
 # - attach metadata (file, language, symbol, lines, dependencies)
 # - use Tree-sitter for code-aware chunking
@@ -8,10 +8,25 @@
 import os 
 import subprocess
 import re
-from pathlib import Path
-from typing import List, Dict, Tuple, Any
+import json
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Dict, Tuple, Any, Iterable, Iterator
 from tree_sitter import Language, Parser
 
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:
+    def _dumps(obj) -> str:
+        # compact, unescaped output, so it matches orjson byte for byte
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
 # -------- 1) configuration --------
 
 
@@ -52,6 +67,12 @@ EXT_TO_LANG = {
     ".txt": "text",
 }
 
+# Below this many files chunking runs inline instead of in a process pool; it is
+# also the number of files sent to a worker at a time
+PARALLEL_MIN_FILES = 32
+_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
 LANG_DEFINITION_NODES = {
     "python": ["function_definition", "class_definition"],
     "javascript": ["function_declaration", "method_definition", "class_declaration"],
@@ -68,109 +89,143 @@ for lang in set(EXT_TO_LANG.values()):
     if lang not in ("text", "markdown"):
         TS_LANGS[lang] = Language(TS_LIB_PATH, lang)
 
-# -------- 3) helpers --------
+# One query per language matching its definition nodes, so the AST walk runs in C
+TS_QUERIES = {
+    lang: TS_LANGS[lang].query(" ".join(f"({node_type}) @def" for node_type in node_types))
+    for lang, node_types in LANG_DEFINITION_NODES.items()
+}
+
+# Tree-sitter parsers are not thread-safe, so each thread keeps its own per language
+_PARSER_CACHE = threading.local()
+
+# -------- 3) compiled patterns --------
+# Name and dependency patterns run on decoded text: bytes patterns would make
+# \w ASCII-only and cut non-ASCII identifiers short
+_NAME_RES = {
+    "python": re.compile(r"^\s*(?:def|class)\s+([A-Za-z_]\w*)"),
+    "javascript": re.compile(r"^\s*(?:function|class)\s+([A-Za-z_]\w*)"),
+    "java": re.compile(r"(?:class|interface)\s+([A-Za-z_]\w*)"),
+    "c": re.compile(r"\b([A-Za-z_]\w*)\s*\("),
+    "go": re.compile(r"^\s*func\s+(?:\([^)]+\)\s+)?([A-Za-z_]\w*)\s*\("),
+    "rust": re.compile(r"^\s*(?:fn|struct|enum|trait)\s+([A-Za-z_]\w*)"),
+}
+_NAME_RES["cpp"] = _NAME_RES["c"]
+
+_DEP_RES = {
+    "python": [
+        re.compile(r"(?m)^\s*import\s+([a-zA-Z_][\w\.]*)"),
+        re.compile(r"(?m)^\s*from\s+([a-zA-Z_][\w\.]*)\s+import\s+"),
+    ],
+    "javascript": [
+        re.compile(r"(?m)^\s*import\s+(?:.+?\s+from\s+)?['\"]([^'\"]+)['\"]"),
+        re.compile(r"require\(['\"]([^'\"]+)['\"]\)"),
+    ],
+    "java": [re.compile(r"(?m)^\s*import\s+([a-zA-Z_][\w\.]*);")],
+    "c": [re.compile(r"(?m)^\s*#\s*include\s+[<\"]([^>\"]+)[>\"]")],
+    "rust": [re.compile(r"(?m)^\s*use\s+([a-zA-Z_][\w:]*)(?:\s*as\s*\w+)?\s*;")],
+}
+_DEP_RES["cpp"] = _DEP_RES["c"]
+
+_GO_IMPORT_RE = re.compile(r"(?s)import\s*(?:\(\s*([\s\S]*?)\s*\)|\"([^\"]+)\")")
+_GO_QUOTED_RE = re.compile(r"\"([^\"]+)\"")
+# links and fenced code block languages in one scan of the document
+_MD_DEP_RE = re.compile(r"\[.+?\]\(([^)]+)\)|```(\w+)")
+_MD_HEAD_RE = re.compile(r"(?m)(^#{1,6}\s+.*$)")
+
+# -------- 4) helpers --------
 def detect_language(file_path: str) -> str:
-    ext = Path(file_path).suffix.lower()
+    ext = os.path.splitext(file_path)[1].lower()
     return EXT_TO_LANG.get(ext, "text")
 
-def _node_text(content: str, node) -> str:
-    return content[node.start_byte:node.end_byte]
-
-def _safe_name_for(language: str, node, content: str) -> str:
-    text = _node_text(content, node)
-    if language == "python":
-        m = re.search(r"^\s*(?:def|class)\s+([A-Za-z_]\w*)", text)
-    elif language == "javascript":
-        m = re.search(r"^\s*(?:function|class)\s+([A-Za-z_]\w*)", text)
-    elif language == "java":
-        m = re.search(r"(?:class|interface)\s+([A-Za-z_]\w*)", text)
-    elif language in ("c", "cpp"):
-        m = re.search(r"\b([A-Za-z_]\w*)\s*\(", text)
-    elif language == "go":
-        m = re.search(r"^\s*func\s+(?:\([^)]+\)\s+)?([A-Za-z_]\w*)\s*\(", text)
-    elif language == "rust":
-        m = re.search(r"^\s*(?:fn|struct|enum|trait)\s+([A-Za-z_]\w*)", text)
-    else:
-        m = None
+def _get_parser(language: str) -> Parser:
+    parsers = getattr(_PARSER_CACHE, "parsers", None)
+    if parsers is None:
+        parsers = _PARSER_CACHE.parsers = {}
+    parser = parsers.get(language)
+    if parser is None:
+        parser = Parser()
+        parser.set_language(TS_LANGS[language])
+        parsers[language] = parser
+    return parser
+
+def _decode(data: bytes) -> str:
+    # Normalize newlines like text-mode reads did, so CRLF checkouts yield the
+    # same chunks (and content hashes) as LF ones; byte offsets stay on data
+    return data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+
+def _node_text(data: bytes, node) -> str:
+    # Tree-sitter reports byte offsets, so slice the raw source, not a str
+    return _decode(data[node.start_byte:node.end_byte])
+
+def _safe_name_for(language: str, text: str) -> str:
+    pattern = _NAME_RES.get(language)
+    if pattern is None:
+        return None
+    m = pattern.search(text)
     return m.group(1) if m else None
 
 def extract_dependencies(language: str, content: str) -> List[str]:
     deps = []
-    if language == "python":
-        deps += re.findall(r"(?m)^\s*import\s+([a-zA-Z_][\w\.]*)", content)
-        deps += re.findall(r"(?m)^\s*from\s+([a-zA-Z_][\w\.]*)\s+import\s+", content)
-    elif language == "javascript":
-        deps += re.findall(r"(?m)^\s*import\s+(?:.+?\s+from\s+)?['\"]([^'\"]+)['\"]", content)
-        deps += re.findall(r"require\(['\"]([^'\"]+)['\"]\)", content)
-    elif language == "java":
-        deps += re.findall(r"(?m)^\s*import\s+([a-zA-Z_][\w\.]*);", content)
-    elif language in ("c", "cpp"):
-        deps += re.findall(r"(?m)^\s*#\s*include\s+[<\"]([^>\"]+)[>\"]", content)
-    elif language == "go":
-        deps += re.findall(r"(?s)import\s*(?:\(\s*([\s\S]*?)\s*\)|\"([^\"]+)\")", content)
-        norm = []
-        for g in deps:
-            block, single = g
+    if language == "go":
+        for block, single in _GO_IMPORT_RE.findall(content):
             if block:
-                norm += re.findall(r"\"([^\"]+)\"", block)
+                deps += _GO_QUOTED_RE.findall(block)
             elif single:
-                norm.append(single)
-        deps = [d for d in norm if d]
-    elif language == "rust":
-        deps += re.findall(r"(?m)^\s*use\s+([a-zA-Z_][\w:]*)(?:\s*as\s*\w+)?\s*;", content)
+                deps.append(single)
+        deps = [d for d in deps if d]
     elif language == "markdown":
-        deps += re.findall(r"\[.+?\]\(([^)]+)\)", content)
-        deps += [f"codeblock:{lang}" for lang in re.findall(r"```(\w+)", content)]
+        for link, lang in _MD_DEP_RE.findall(content):
+            deps.append(link or f"codeblock:{lang}")
+    else:
+        for pattern in _DEP_RES.get(language, ()):
+            deps += pattern.findall(content)
     return sorted(set(deps))
 
-# -------- 4) chunking --------
-def chunk_code(file_path: str, content: str, language: str) -> List[Dict[str, Any]]:
-    parser = Parser()
-    parser.set_language(TS_LANGS[language])
-    tree = parser.parse(bytes(content, "utf8"))
+# -------- 5) chunking --------
+def chunk_code(file_path: str, data: bytes, language: str) -> List[Dict[str, Any]]:
+    parser = _get_parser(language)
+    tree = parser.parse(data)
     root = tree.root_node
 
-    def_nodes = LANG_DEFINITION_NODES.get(language, [])
     chunks = []
 
-    stack = [root]
-    while stack:
-        node = stack.pop()
-        stack.extend(reversed(node.children))
-        if node.type in def_nodes:
-            chunks.append({
-                "content": _node_text(content, node),
-                "metadata": {
-                    "file_path": file_path,
-                    "language": language,
-                    "node_type": node.type,
-                    "symbol_name": _safe_name_for(language, node, content),
-                    "start_line": node.start_point[0]+1,
-                    "end_line": node.end_point[0]+1,
-                }
-            })
+    for node, _ in TS_QUERIES[language].captures(root):
+        text = _node_text(data, node)
+        chunks.append({
+            "content": text,
+            "metadata": {
+                "file_path": file_path,
+                "language": language,
+                "node_type": node.type,
+                "symbol_name": _safe_name_for(language, text),
+                "start_line": node.start_point[0]+1,
+                "end_line": node.end_point[0]+1,
+            }
+        })
 
     if not chunks:
         chunks.append({
-            "content": content,
+            "content": _decode(data),
             "metadata": {
                 "file_path": file_path,
                 "language": language,
                 "node_type": "file",
-                "symbol_name": Path(file_path).name,
+                "symbol_name": os.path.basename(file_path),
                 "start_line": 1,
-                "end_line": len(content.splitlines()) or 1,
+                "end_line": len(data.splitlines()) or 1,
             }
         })
     return chunks
 
 def chunk_markdown(file_path: str, content: str) -> List[Dict[str, Any]]:
-    parts = re.split(r"(?m)(^#{1,6}\s+.*$)", content)
+    # each section runs from one heading to the next, sliced straight out of content
+    positions = [m.start() for m in _MD_HEAD_RE.finditer(content)]
+    if not positions or positions[0] > 0:
+        positions.insert(0, 0)
+    positions.append(len(content))
     sections = []
-    for i in range(0, len(parts), 2):
-        heading = parts[i]
-        body = parts[i+1] if i+1 < len(parts) else ""
-        block = (heading + body).strip()
+    for start, end in zip(positions, positions[1:]):
+        block = content[start:end].strip()
         if block:
             sections.append(block)
 
@@ -214,10 +269,18 @@ def chunk_markdown(file_path: str, content: str) -> List[Dict[str, Any]]:
 
 def chunk_text(file_path: str, content: str) -> List[Dict[str, Any]]:
     LINES_PER_CHUNK = 80
-    lines = content.splitlines()
+    # offsets of every line start, so each block is one slice of content
+    # instead of a join over a list of all lines
+    offsets = [0]
+    pos = content.find("\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = content.find("\n", pos + 1)
+
     chunks = []
-    for i in range(0, len(lines), LINES_PER_CHUNK):
-        part = "\n".join(lines[i:i+LINES_PER_CHUNK]).strip()
+    for i in range(0, len(offsets), LINES_PER_CHUNK):
+        end = offsets[i + LINES_PER_CHUNK] if i + LINES_PER_CHUNK < len(offsets) else len(content)
+        part = content[offsets[i]:end].strip()
         if part:
             chunks.append({
                 "content": part,
@@ -234,37 +297,75 @@ def chunk_text(file_path: str, content: str) -> List[Dict[str, Any]]:
         })
     return chunks
 
-# -------- 5) public API --------
-def chunk_file(file_path: str, content: str) -> List[Dict[str, Any]]:
+# -------- 6) public API --------
+def chunk_file(file_path: str, data: bytes) -> List[Dict[str, Any]]:
     language = detect_language(file_path)
+    content = _decode(data)
     deps = extract_dependencies(language, content)
 
+    # Tree-sitter parses the raw bytes, since its node offsets are byte offsets
     if language == "markdown":
         chunks = chunk_markdown(file_path, content)
     elif language != "text":
-        chunks = chunk_code(file_path, content, language)
+        chunks = chunk_code(file_path, data, language)
     else:
         chunks = chunk_text(file_path, content)
 
-    # add dependencies and chunk_id
+    # add dependencies and chunk_id; deps are serialized once per file since
+    # every chunk shares them and the vector store only takes scalar metadata
+    deps_json = _dumps(deps)
     for idx, ch in enumerate(chunks):
-        ch["metadata"]["dependencies"] = deps
+        ch["metadata"]["dependencies"] = deps_json
         ch["metadata"]["chunk_id"] = f"{file_path}::chunk{idx}"
     return chunks
 
-def chunk_codebase(files: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
-    all_chunks = []
-    for file_path, content in files:
-        try:
-            all_chunks.extend(chunk_file(file_path, content))
-        except Exception as e:
-            all_chunks.append({
-                "content": content[:2000],
-                "metadata": {"file_path": file_path, "language": "text",
-                             "node_type": "error_fallback", "symbol_name": None,
-                             "chunk_id": f"{file_path}::error0",
-                             "dependencies": [], "error": str(e)}
-            })
-    return all_chunks
+def _chunk_file_safe(item: Tuple[str, bytes]) -> List[Dict[str, Any]]:
+    file_path, data = item
+    try:
+        return chunk_file(file_path, data)
+    except Exception as e:
+        return [{
+            "content": _decode(data[:2000]),
+            "metadata": {"file_path": file_path, "language": "text",
+                         "node_type": "error_fallback", "symbol_name": None,
+                         "chunk_id": f"{file_path}::error0",
+                         "dependencies": "[]", "error": str(e)}
+        }]
+
+def _chunk_files_safe(items: List[Tuple[str, bytes]]) -> List[Dict[str, Any]]:
+    chunks = []
+    for item in items:
+        chunks.extend(_chunk_file_safe(item))
+    return chunks
+
+def chunk_codebase(files: List[Tuple[str, bytes]]) -> List[Dict[str, Any]]:
+    return list(chunk_stream(files))
 
+def chunk_stream(files: Iterable[Tuple[str, bytes]]) -> Iterator[Dict[str, Any]]:
+    files = iter(files)
+    # Small repos are chunked inline, where pool start-up would cost more than it saves
+    head = list(islice(files, PARALLEL_MIN_FILES))
+    if len(head) < PARALLEL_MIN_FILES:
+        yield from _chunk_files_safe(head)
+        return
 
+    # Files are independent, so spread batches of them over a process pool.
+    # Batches are submitted only as results are consumed, keeping at most a
+    # couple per worker in flight instead of reading the whole input up front.
+    # Workers are not forked: the caller may be running other threads (the
+    # pipeline stages, the encoder), and forking a threaded process can deadlock.
+    workers = os.cpu_count() or 1
+    pending = deque()
+    ex = ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT)
+    try:
+        batch = head
+        while batch:
+            pending.append(ex.submit(_chunk_files_safe, batch))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+            batch = list(islice(files, PARALLEL_MIN_FILES))
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # also reached when the consumer stops early; drop work not yet started
+        ex.shutdown(cancel_futures=True)
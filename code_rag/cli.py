@@ -18,40 +18,101 @@
     # print("\nAnswer:\n", answer)
 
 import argparse
-from code_rag.pipeline import CodeRAGPipeline
+import os
+import socket
+import socketserver
+import stat
+import sys
+from typing import TYPE_CHECKING
+
+# The pipeline pulls in the models, the vector store and the Tree-sitter build;
+# it is imported in main() so that --connect stays a thin client
+if TYPE_CHECKING:
+    from code_rag.pipeline import CodeRAGPipeline
+
+
+def run_query(pipeline: "CodeRAGPipeline", query: str) -> str:
+    """Retrieve chunks for a query and answer it, returning the printable report."""
+    results = pipeline.query(query, top_k=10)
+
+    lines = ["\n📌 Query Results:"]
+    for i, doc in enumerate(results["documents"][0], start=1):
+        lines.append(f"\nResult {i}:")
+        lines.append(doc)
+
+    answer = pipeline.answer(query)
+    lines.append(f"🤖 Answer:\n {answer}")
+    return "\n".join(lines)
+
+
+def serve(pipeline: "CodeRAGPipeline", socket_path: str):
+    """
+    Keep the indexed pipeline (and its loaded models) resident, answering one
+    query per connection on a Unix socket.
+    """
+    class QueryHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            query = self.rfile.readline().decode("utf-8").strip()
+            if query:
+                self.wfile.write(run_query(pipeline, query).encode("utf-8"))
+
+    if os.path.exists(socket_path):
+        # only clear a stale socket left by an earlier run, never a regular file
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            sys.exit(f"Error: {socket_path} exists and is not a socket.")
+        os.remove(socket_path)
+    with socketserver.UnixStreamServer(socket_path, QueryHandler) as server:
+        print(f"🟢 Serving queries on {socket_path} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def send_query(socket_path: str, query: str) -> str:
+    """Send a query to a running `--serve` process and return its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(query.encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        reply = b"".join(iter(lambda: sock.recv(65536), b""))
+    return reply.decode("utf-8")
+
 
 def main():
     parser = argparse.ArgumentParser(description="CodeRAG: RAG for Codebases")
     parser.add_argument("--path", help="Local repo path")
     parser.add_argument("--repo", help="GitHub repo URL")
-    parser.add_argument("--query", required=True, help="Your question about the codebase")
+    parser.add_argument("--query", help="Your question about the codebase")
+    parser.add_argument("--serve", metavar="SOCKET",
+                        help="Index once, then keep answering queries on this Unix socket")
+    parser.add_argument("--connect", metavar="SOCKET",
+                        help="Send --query to a process started with --serve")
     args = parser.parse_args()
 
-    pipeline = CodeRAGPipeline(path=args.path, repo=args.repo)
-
-    print("📂 Ingesting files...")
-    pipeline.ingest()
-    print(f"✅ Ingested {len(pipeline.files)} files")
-
-    print("\n✂️ Chunking files...")
-    pipeline.chunk()
-    print(f"✅ Created {len(pipeline.chunks)} chunks")
+    if args.connect:
+        if not args.query:
+            parser.error("--connect requires --query")
+        print(send_query(args.connect, args.query))
+        return
 
-    print("\n🔢 Creating embeddings...")
-    pipeline.embed()
+    if not args.query and not args.serve:
+        parser.error("--query is required unless --serve is given")
 
-    print("\n🔎 Querying...")
-    results = pipeline.query(args.query, top_k=10)
-
-    print("\n📌 Query Results:")
-    for i, doc in enumerate(results["documents"][0], start=1):
-        print(f"\nResult {i}:")
-        print(doc)
+    from code_rag.pipeline import CodeRAGPipeline
+    pipeline = CodeRAGPipeline(path=args.path, repo=args.repo)
 
-    answer = pipeline.answer(args.query)
-    print("🤖 Answer:\n", answer)
+    print("📂 Ingesting, chunking and embedding files...")
+    pipeline.build_index()
 
+    if args.serve:
+        serve(pipeline, args.serve)
+        return
 
+    print("\n🔎 Querying...")
+    print(run_query(pipeline, args.query))
 
 
 if __name__ == "__main__":
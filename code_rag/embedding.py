@@ -1,61 +1,280 @@
 # embedding.py
 from sentence_transformers import SentenceTransformer
 import chromadb
+import hashlib
 import json
+import os
+from typing import Iterable
+import numpy as np
+import torch
+
+try:
+    import faiss
+except ImportError:  # optional: fall back to querying ChromaDB
+    faiss = None
+
+
+# Upper bound on characters per token for source code (typically 3-4), used to
+# clip texts that could not fit in the model's context anyway
+MAX_CHARS_PER_TOKEN = 8
+
+# Vector store and FAISS index live here, so re-runs only embed changed chunks
+CACHE_DIR = os.environ.get("CODERAG_CACHE", os.path.expanduser("~/.cache/coderag"))
+
+# The encoder and the Chroma client are loaded once per process and shared
+# by every Embedder (the pipeline and the LLM responder each hold one).
+_MODEL = None
+_CLIENT = None
+
+
+def _get_model() -> SentenceTransformer:
+    global _MODEL
+    if _MODEL is None:
+        # Load Qodo embedding model (half precision on GPU halves activation memory)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model_kwargs = {"torch_dtype": torch.float16} if device == "cuda" else {}
+        _MODEL = SentenceTransformer(
+            "Qodo/Qodo-Embed-1-1.5B", device=device, model_kwargs=model_kwargs
+        )
+        # _MODEL = SentenceTransformer("google/embeddinggemma-300m",token="")
+    return _MODEL
+
+
+def _get_client():
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = chromadb.PersistentClient(path=os.path.join(CACHE_DIR, "chroma"))
+    return _CLIENT
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _faiss_id(record_id: str) -> int:
+    # FAISS ids are int64 and -1 means "no hit", so keep the hash non-negative
+    digest = hashlib.blake2b(record_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFF_FFFF_FFFF_FFFF
 
 
 class Embedder:
     def __init__(self, collection_name="code_chunks"):
-        # Load Qodo embedding model
-        self.model = SentenceTransformer("Qodo/Qodo-Embed-1-1.5B")
-        # self.model = SentenceTransformer("google/embeddinggemma-300m",token="")
+        self.model = _get_model()
         # Initialize ChromaDB client
-        self.client = chromadb.Client()
+        self.client = _get_client()
 
         # Create or get collection
         self.collection = self.client.get_or_create_collection(
             name=collection_name
         )
 
+        # In-process FAISS copy of the stored vectors (inner product on normalized
+        # embeddings). Rows are keyed by _faiss_id(record id), which is also stored
+        # as "faiss_id" metadata so documents can be fetched from Chroma by hit.
+        self.index = None
+        self.index_dir = os.path.join(CACHE_DIR, "faiss", collection_name)
+        self.load_index(self.index_dir)
+
     def _sanitize_metadata(self, metadata: dict) -> dict:
-        """Ensure metadata values are ChromaDB-compatible (no lists/dicts)."""
-        clean_meta = {}
-        for k, v in metadata.items():
-            if isinstance(v, (list, dict)):
-                clean_meta[k] = json.dumps(v)  # Convert to JSON string
-            else:
-                clean_meta[k] = str(v)
-        return clean_meta
- 
-    def create_embeddings(self, chunks: list[dict]):
+        """Ensure metadata values are ChromaDB-compatible (no lists/dicts/None)."""
+        return {k: v if isinstance(v, (str, int, float, bool))
+                else json.dumps(v, separators=(",", ":"), ensure_ascii=False)
+                for k, v in metadata.items()}
+
+    def _clip(self, texts: list[str]) -> list[str]:
         """
-        Create embeddings for chunks and store them in ChromaDB.
-        Each chunk is a dict with keys: content, metadata.
+        Cut texts far beyond the model's context before encoding. The tokenizer
+        processes a text in full before truncating it to max_seq_length, so
+        whole-file fallback chunks would otherwise be tokenized for nothing.
+        Text is only lost when a clipped text averages more than
+        MAX_CHARS_PER_TOKEN characters per token (e.g. long whitespace runs),
+        in which case the embedding covers fewer than max_seq_length tokens.
+        """
+        if not self.model.max_seq_length:
+            return texts
+        limit = self.model.max_seq_length * MAX_CHARS_PER_TOKEN
+        return [text[:limit] for text in texts]
+
+    def _store(self, chunks: list[dict], existing: set, seen: set) -> int:
+        """
+        Add to ChromaDB the chunks whose ids are not already stored, encoding
+        only content that has no stored vector yet. Ids combine the chunk id with
+        a hash of its content, so an edited chunk gets a new id. Records every id
+        in seen; returns how many records were added.
         """
+        hashes = [_content_hash(chunk["content"]) for chunk in chunks]
+        ids = [f"{chunk['metadata']['chunk_id']}#{h}" for chunk, h in zip(chunks, hashes)]
+        seen.update(ids)
+        todo = [i for i, id_ in enumerate(ids) if id_ not in existing]
+        if not todo:
+            return 0
+        chunks = [chunks[i] for i in todo]
+        hashes = [hashes[i] for i in todo]
+        ids = [ids[i] for i in todo]
+
         texts = [chunk["content"] for chunk in chunks]
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
+        # Identical chunks (licenses, boilerplate, generated code) are encoded once:
+        # reuse any vector already stored for the same content, whether from an
+        # earlier batch of this run or a chunk that only moved (e.g. chunkN shifted)
+        vectors = self._stored_vectors(hashes)
+        new = {h: text for h, text in zip(hashes, texts) if h not in vectors}
+        if new:
+            encoded = self.model.encode(
+                self._clip(list(new.values())),
+                batch_size=64,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            vectors.update(zip(new, encoded))
+        embeddings = np.asarray([vectors[h] for h in hashes], dtype=np.float32)
+
+        faiss_ids = [_faiss_id(id_) for id_ in ids]
+        metadatas = [self._sanitize_metadata({**chunk["metadata"], "content_hash": h,
+                                              "faiss_id": fid})
+                     for chunk, h, fid in zip(chunks, hashes, faiss_ids)]
+        embeddings_list = embeddings.tolist()
 
-        for i, chunk in enumerate(chunks):
-            safe_metadata = self._sanitize_metadata(chunk["metadata"])
+        # Chroma caps the number of records per add() call, so insert in the
+        # largest batches it accepts rather than one record at a time.
+        step = self.client.get_max_batch_size()
+        for start in range(0, len(chunks), step):
+            end = start + step
             self.collection.add(
-                ids=[f"chunk_{i}"],
-                documents=[chunk["content"]],
-                embeddings=[embeddings[i].tolist()],
-                metadatas=[safe_metadata]
+                ids=ids[start:end],
+                documents=texts[start:end],
+                embeddings=embeddings_list[start:end],
+                metadatas=metadatas[start:end]
             )
-        print(f"✅ Stored {len(chunks)} chunks in collection '{self.collection.name}'")
+        if faiss is not None:
+            self._index_add(embeddings, faiss_ids)
+        return len(chunks)
+
+    def _stored_vectors(self, hashes: list[str]) -> dict:
+        """Map content hashes to embeddings already stored in the collection."""
+        stored = self.collection.get(
+            where={"content_hash": {"$in": list(set(hashes))}},
+            include=["embeddings", "metadatas"],
+        )
+        return {meta["content_hash"]: embedding
+                for meta, embedding in zip(stored["metadatas"], stored["embeddings"])}
+
+    def _index_add(self, embeddings: np.ndarray, faiss_ids: list[int]):
+        if self.index is None:
+            self.index = faiss.IndexIDMap(faiss.IndexFlatIP(embeddings.shape[1]))
+        self.index.add_with_ids(embeddings.astype(np.float32),
+                                np.asarray(faiss_ids, dtype=np.int64))
+
+    def _sync(self, stale: list[str], added: int):
+        """Delete the stale records and bring the FAISS index up to date."""
+        step = self.client.get_max_batch_size()
+        for start in range(0, len(stale), step):
+            self.collection.delete(ids=stale[start:start + step])
+        if faiss is None:
+            return
+
+        changed = bool(added or stale)
+        if stale and self.index is not None:
+            self.index.remove_ids(np.asarray([_faiss_id(id_) for id_ in stale], dtype=np.int64))
+        # A missing index (faiss installed after the store was built) or one out of
+        # step with the store (an earlier run died before saving) is rebuilt once
+        current = self.index.ntotal if self.index is not None else 0
+        if current != self.collection.count():
+            self._rebuild_index()
+            changed = True
+        if changed:
+            self.save_index(self.index_dir)
+
+    def _rebuild_index(self):
+        """Rebuild the FAISS index from the collection, one page at a time."""
+        self.index = None
+        step = self.client.get_max_batch_size()
+        for offset in range(0, self.collection.count(), step):
+            page = self.collection.get(include=["embeddings"], limit=step, offset=offset)
+            self._index_add(np.asarray(page["embeddings"], dtype=np.float32),
+                            [_faiss_id(id_) for id_ in page["ids"]])
+
+    def create_embeddings(self, chunks: list[dict], prune: bool = False):
+        """
+        Create embeddings for chunks and store them in ChromaDB.
+        Each chunk is a dict with keys: content, metadata.
+        With prune=True, chunks is the whole repo and stored records not in it are deleted.
+        """
+        self.stream_embed(chunks, prune=prune)
+
+    def stream_embed(self, chunks: Iterable[dict], batch_size: int = 64, prune: bool = False) -> int:
+        """
+        Embed and store chunks as they arrive, holding at most batch_size in memory.
+        With prune=True, chunks is the whole repo: stored records that did not
+        come up in this run (deleted files, edited chunks) are removed afterwards.
+        Returns the number of chunks stored.
+        """
+        existing = set(self.collection.get(include=[])["ids"])
+        seen = set()
+        total = added = 0
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                added += self._store(batch, existing, seen)
+                total += len(batch)
+                batch = []
+        if batch:
+            added += self._store(batch, existing, seen)
+            total += len(batch)
+        self._sync(list(existing - seen) if prune else [], added)
+        print(f"✅ Stored {total} chunks in collection '{self.collection.name}' "
+              f"({added} new or changed)")
+        return total
 
     def query(self, query_text: str, top_k: int = 10):
-        """Query ChromaDB for similar chunks based on text input."""
-        query_embedding = self.model.encode([query_text], convert_to_numpy=True)[0]
+        """Query ChromaDB (or the FAISS index, when built) for similar chunks based on text input."""
+        query_embedding = self.model.encode(
+            [query_text], convert_to_numpy=True, normalize_embeddings=True
+        )
+        if self.index is not None and self.index.ntotal:
+            return self._query_index(query_embedding.astype(np.float32), top_k)
         results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],
+            query_embeddings=[query_embedding[0].tolist()],
             n_results=top_k
         )
         return results
 
+    def _query_index(self, query_embedding: np.ndarray, top_k: int) -> dict:
+        """Search the FAISS index, returning results shaped like ChromaDB's."""
+        scores, rows = self.index.search(query_embedding, top_k)
+        hits = [(int(row), float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+        # Documents live in Chroma only; fetch the hits by their faiss_id metadata
+        stored = self.collection.get(
+            where={"faiss_id": {"$in": [row for row, _ in hits]}},
+            include=["documents", "metadatas"],
+        ) if hits else {"ids": [], "documents": [], "metadatas": []}
+        by_row = {meta["faiss_id"]: (id_, doc, meta) for id_, doc, meta
+                  in zip(stored["ids"], stored["documents"], stored["metadatas"])}
+        hits = [(row, score) for row, score in hits if row in by_row]
+        return {
+            "ids": [[by_row[row][0] for row, _ in hits]],
+            "documents": [[by_row[row][1] for row, _ in hits]],
+            "metadatas": [[by_row[row][2] for row, _ in hits]],
+            # squared L2 between unit vectors, matching Chroma's default distance
+            "distances": [[2 - 2 * score for _, score in hits]],
+        }
 
+    def save_index(self, directory: str):
+        """Write the FAISS index to a directory."""
+        index_path = os.path.join(directory, "index.faiss")
+        if self.index is None:
+            # nothing stored any more; don't let a stale index be loaded next run
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            return
+        os.makedirs(directory, exist_ok=True)
+        faiss.write_index(self.index, index_path)
 
-
-
-
+    def load_index(self, directory: str) -> bool:
+        """Load an index written by save_index(). Returns False if there is none to load."""
+        index_path = os.path.join(directory, "index.faiss")
+        if faiss is None or not os.path.exists(index_path):
+            return False
+        self.index = faiss.read_index(index_path)
+        return True
@@ -1,9 +1,22 @@
 # ingestion.py
+import hashlib
 import os
 import tempfile
 import subprocess
-from pathlib import Path
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
+
+CODE_EXTENSIONS = frozenset([".py", ".js", ".ts", ".java", ".cpp", ".c", ".go", ".rs", ".md",
+                             ".txt", ".json", ".yaml", ".toml"])
+
+# Lockfiles, dependency/VCS directories and oversized files cost ingest and
+# embedding time without telling us anything about the code
+SKIP_FILES = frozenset(["package-lock.json", "yarn.lock", "poetry.lock", "pnpm-lock.yaml",
+                        "Cargo.lock"])
+SKIP_DIRS = frozenset([".git", "node_modules", "__pycache__", ".venv", "venv"])
+MAX_FILE_SIZE = 1_000_000
+
+# Files with a NUL byte in this many leading bytes are treated as binary
+BINARY_SNIFF_BYTES = 4096
 
 
 class CodeIngestion:
@@ -15,6 +28,19 @@ class CodeIngestion:
         self.local_path = local_path
         self.clone_dir = None
 
+    def source_id(self) -> str:
+        """
+        Stable id for the repo being ingested: the remote URL, or the resolved
+        local path, hashed. Used to keep one vector store per repo.
+        """
+        if self.repo_url:
+            source = self.repo_url.rstrip("/").removesuffix(".git")
+        elif self.local_path:
+            source = os.path.realpath(self.local_path)
+        else:
+            raise ValueError("Repo URL or local path required!")
+        return hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+
     def clone_repo(self) -> str:
         """
         Clone the GitHub repo into a temp directory.
@@ -27,41 +53,67 @@ class CodeIngestion:
         subprocess.run(["git", "clone", self.repo_url, self.clone_dir], check=True)
         return self.clone_dir
 
-    def get_code_files(self, path: str) -> List[str]:
+    def get_code_files(self, path: str) -> Iterator[str]:
         """
         Collect all code files from a given directory.
         You can filter extensions as per your use case.
         """
-        extensions = [".py", ".js", ".ts", ".java", ".cpp", ".c", ".go", ".rs",".md",
-                      ".txt", ".json", ".yaml", ".toml"]
-        code_files = []
-        for p in Path(path).rglob("*"):
-            if p.is_file() and p.suffix in extensions:
-                code_files.append(str(p))
-        return code_files
-    
-
-
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError as e:
+                # unreadable or missing directories are skipped, not fatal
+                print(f"Could not read {directory}: {e}")
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIRS:
+                            stack.append(entry.path)
+                    elif (entry.is_file()
+                          and os.path.splitext(entry.name)[1] in CODE_EXTENSIONS
+                          and entry.name not in SKIP_FILES
+                          and entry.stat().st_size <= MAX_FILE_SIZE):
+                        yield entry.path
 
-    def read_files(self, files: List[str]) -> List[Tuple[str, str]]:
+    def read_files(self, files: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
         """
-        Read the contents of code files.
-        Returns a list of tuples: (file_path, file_content)
+        Read the raw contents of code files; decoding is left to the chunker.
+        Binary files are skipped. Yields tuples: (file_path, file_bytes)
         """
-        file_contents = []
         for f in files:
             try:
-                with open(f, "r", encoding="utf-8", errors="ignore") as file:
-                    file_contents.append((f, file.read()))
+                with open(f, "rb") as file:
+                    head = file.read(BINARY_SNIFF_BYTES)
+                    if b"\x00" in head:
+                        continue
+                    data = head + file.read()
             except Exception as e:
                 print(f"Could not read {f}: {e}")
-        return file_contents
+                continue
+            yield f, data
 
-    def ingest(self) -> List[Tuple[str, str]]:
+    def _relative(self, items: Iterable[Tuple[str, bytes]], base_path: str) -> Iterator[Tuple[str, bytes]]:
+        # Paths relative to the repo root (with / separators) keep chunk ids the
+        # same across clones, checkout locations and platforms
+        for f, data in items:
+            yield os.path.relpath(f, base_path).replace(os.sep, "/"), data
+
+    def ingest(self) -> List[Tuple[str, bytes]]:
         """
         Main entry point: clone (if needed), collect files, return their contents.
+        File paths are relative to the repo root.
         """
         base_path = self.local_path or self.clone_repo()
-        files = self.get_code_files(base_path)
+        files = list(self.get_code_files(base_path))
         print(f"Found {len(files)} code files")
-        return self.read_files(files)
+        return list(self._relative(self.read_files(files), base_path))
+
+    def stream(self) -> Iterator[Tuple[str, bytes]]:
+        """
+        Streaming variant of ingest(): yield (file_path, file_bytes) as files are read.
+        """
+        base_path = self.local_path or self.clone_repo()
+        return self._relative(self.read_files(self.get_code_files(base_path)), base_path)
@@ -4,7 +4,7 @@ from code_rag.embedding import Embedder
 
 
 class LLMResponder:
-    def __init__(self, model_name="microsoft/phi-2", collection_name="code_chunks"):
+    def __init__(self, model_name="microsoft/phi-2", collection_name="code_chunks", embedder=None):
         # Load a lightweight local model for text generation
         self.generator = pipeline(
             "text-generation",
@@ -12,7 +12,8 @@ class LLMResponder:
             device_map="auto",   # uses GPU if available, else CPU
             torch_dtype="auto"
         )
-        self.embedder = Embedder(collection_name=collection_name)
+        # Reuse the caller's embedder when given, so queries see its FAISS index
+        self.embedder = embedder or Embedder(collection_name=collection_name)
 
     def build_prompt(self, query: str, retrieved_chunks: dict) -> str:
         """Combine query + retrieved chunks into a single system prompt."""
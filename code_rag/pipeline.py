@@ -1,7 +1,57 @@
+import queue
+import threading
 from code_rag import ingestion,chunking
 from code_rag.embedding import Embedder
 from code_rag.llm_response import LLMResponder
 
+# Max items buffered between pipeline stages
+STAGE_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+def _threaded(items, maxsize=STAGE_QUEUE_SIZE):
+    """Produce items on a background thread, handing them over through a bounded queue."""
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up once the consumer has gone away instead of blocking forever
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+        finally:
+            # Closing the source runs its own cleanup, e.g. shutting down a process pool
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
 class CodeRAGPipeline:
     def __init__(self, path=None, repo=None):
         self.repo_path = path
@@ -9,11 +59,13 @@ class CodeRAGPipeline:
         self.files = []
         self.chunks = []
         self.vector_store = None
-        self.embedder = Embedder()
+        self.ingestor = ingestion.CodeIngestion(repo_url=repo, local_path=path)
+        # one collection per repo, so indexing another repo leaves this one cached
+        self.embedder = Embedder(collection_name=f"code_chunks_{self.ingestor.source_id()}")
+        self.responder = None
 
     def ingest(self):
-        ingestor = ingestion.CodeIngestion(self.repo_path, self.repo_url)
-        self.files = ingestor.ingest()
+        self.files = self.ingestor.ingest()
 
     def chunk(self):
         self.chunks = chunking.chunk_codebase(self.files)
@@ -22,8 +74,29 @@ class CodeRAGPipeline:
         """Create embeddings for the chunks and store in ChromaDB"""
         if not self.chunks:
             raise ValueError("No chunks found. Run chunk() first.")
-        self.embedder.create_embeddings(self.chunks)
+        self.embedder.create_embeddings(self.chunks, prune=True)
+
+    def build_index(self, batch_size: int = 64) -> int:
+        """
+        Ingest, chunk and embed as overlapping stages instead of one after another.
+        Reading and chunking run on background threads feeding the embedder, so only
+        a few batches of chunks are held in memory. Returns the number of chunks stored.
+        """
+        # Each stage holds the only reference to the one before it, so closing the
+        # last stage stops the whole chain if embedding fails part way
+        chunks = _threaded(chunking.chunk_stream(_threaded(self.ingestor.stream())),
+                           maxsize=STAGE_QUEUE_SIZE * batch_size)
+        try:
+            return self.embedder.stream_embed(chunks, batch_size=batch_size, prune=True)
+        finally:
+            chunks.close()
 
     def query(self, query_text: str, top_k: int = 10):
         """Query stored embeddings with a user query"""
         return self.embedder.query(query_text, top_k=top_k)
+
+    def answer(self, query_text: str, top_k: int = 5) -> str:
+        """Answer a question with the LLM, using retrieved chunks as context"""
+        if self.responder is None:
+            self.responder = LLMResponder(embedder=self.embedder)
+        return self.responder.answer(query_text, top_k=top_k)
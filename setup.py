@@ -0,0 +1,14 @@
+# setup.py
+# Optional ahead-of-time compilation of code_rag/chunking.py with Cython.
+# Cython is not a build requirement, so install it first and build with
+# `CODERAG_CYTHON=1 pip install --no-build-isolation .` (or `python setup.py build_ext --inplace`);
+# the compiled module is picked up ahead of chunking.py, which stays as the fallback.
+import os
+from setuptools import setup
+
+ext_modules = []
+if os.environ.get("CODERAG_CYTHON") == "1":
+    from Cython.Build import cythonize
+    ext_modules = cythonize("code_rag/chunking.py", language_level=3)
+
+setup(ext_modules=ext_modules)
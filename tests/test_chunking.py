@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("tree_sitter")
+
+from code_rag import chunking
+
+
+def test_code_chunk_text_after_non_ascii_docstring():
+    # Tree-sitter offsets are byte offsets; slicing decoded text with them
+    # shifted every chunk after a multi-byte character
+    func = "def greet(name):\n    return f\"hi {name}\""
+    data = f'"""Модуль — приветствие ✓"""\n\n{func}\n'.encode("utf-8")
+
+    chunks = chunking.chunk_file("a.py", data)
+
+    funcs = [c for c in chunks if c["metadata"]["node_type"] == "function_definition"]
+    assert [c["content"] for c in funcs] == [func]
+    assert funcs[0]["metadata"]["symbol_name"] == "greet"
+
+
+def test_markdown_sections_pair_with_their_headers():
+    chunks = chunking.chunk_markdown("x.md", "pre\n# H\nbody\n## H2\nb2")
+
+    assert [c["content"] for c in chunks] == ["pre", "# H\nbody", "## H2\nb2"]
+
+
+def test_non_ascii_identifiers_are_kept_whole():
+    chunks = chunking.chunk_file("a.py", "import café\n\ndef größe(x):\n    return x\n".encode("utf-8"))
+
+    funcs = [c for c in chunks if c["metadata"]["node_type"] == "function_definition"]
+    assert funcs[0]["metadata"]["symbol_name"] == "größe"
+    assert funcs[0]["metadata"]["dependencies"] == '["café"]'
+
+
+@pytest.mark.parametrize("n_lines", [80, 160])
+@pytest.mark.parametrize("trailing_newline", [False, True])
+def test_text_blocks_at_exact_multiple_of_block_size(n_lines, trailing_newline):
+    lines = [f"line {i}" for i in range(n_lines)]
+    content = "\n".join(lines) + ("\n" if trailing_newline else "")
+
+    chunks = chunking.chunk_text("notes.txt", content)
+
+    assert [c["content"] for c in chunks] == ["\n".join(lines[i:i + 80]) for i in range(0, n_lines, 80)]
+    assert [c["metadata"]["block_id"] for c in chunks] == list(range(n_lines // 80))
+
+
+def test_go_import_block_and_single_import():
+    content = 'package main\n\nimport (\n\t"fmt"\n\thttp "net/http"\n)\n\nimport "os"\n'
+
+    assert chunking.extract_dependencies("go", content) == ["fmt", "net/http", "os"]
+
+
+def test_markdown_links_mixed_with_code_fences():
+    content = ("See [the docs](docs/setup.md) first.\n\n```python\nprint('[x](y)')\n```\n\n"
+               "Then [home](https://example.com) and\n```bash\nmake\n```\n")
+
+    # same as running the link and fence patterns separately
+    assert chunking.extract_dependencies("markdown", content) == [
+        "codeblock:bash", "codeblock:python", "docs/setup.md", "https://example.com", "y"]
@@ -0,0 +1,130 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("torch")
+
+from code_rag import embedding
+
+
+class FakeModel:
+    """Deterministic stand-in for the encoder that records what it was asked to encode."""
+    max_seq_length = 512
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded += texts
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "big")
+            v = np.random.default_rng(seed).standard_normal(8)
+            vectors.append(v / np.linalg.norm(v))
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), 8)
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(embedding, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding, "_MODEL", model)
+    monkeypatch.setattr(embedding, "_CLIENT", chromadb.PersistentClient(path=str(tmp_path / "chroma")))
+    return model
+
+
+def chunk(path, idx, content):
+    return {"content": content, "metadata": {"file_path": path, "chunk_id": f"{path}::chunk{idx}"}}
+
+
+def stored_ids(embedder):
+    return sorted(embedder.collection.get(include=[])["ids"])
+
+
+def test_unchanged_chunks_are_not_reencoded(model):
+    chunks = [chunk("a.py", 0, "def a(): pass"), chunk("b.py", 0, "def b(): pass")]
+    embedder = embedding.Embedder("code_chunks_test")
+    embedder.stream_embed(chunks, prune=True)
+    ids = stored_ids(embedder)
+
+    model.encoded.clear()
+    embedding.Embedder("code_chunks_test").stream_embed(chunks, prune=True)
+
+    assert model.encoded == []
+    assert stored_ids(embedder) == ids
+
+
+def test_same_content_is_encoded_once_across_batches(model):
+    chunks = [chunk(f"d{i}/LICENSE.txt", 0, "MIT") for i in range(5)] + [chunk("a.py", 0, "def a(): pass")]
+    embedding.Embedder("code_chunks_test").stream_embed(chunks, batch_size=2)
+
+    assert sorted(model.encoded) == ["MIT", "def a(): pass"]
+
+
+def test_shifted_chunk_reuses_its_vector(model):
+    embedder = embedding.Embedder("code_chunks_test")
+    embedder.stream_embed([chunk("a.py", 0, "def a(): pass")], prune=True)
+
+    model.encoded.clear()
+    embedder.stream_embed([chunk("a.py", 0, "def new(): pass"), chunk("a.py", 1, "def a(): pass")], prune=True)
+
+    assert model.encoded == ["def new(): pass"]
+    assert [i.split("#")[0] for i in stored_ids(embedder)] == ["a.py::chunk0", "a.py::chunk1"]
+
+
+def test_prune_deletes_records_not_seen(model):
+    embedder = embedding.Embedder("code_chunks_test")
+    embedder.stream_embed([chunk("a.py", 0, "def a(): pass"), chunk("b.py", 0, "def b(): pass")])
+
+    embedder.stream_embed([chunk("a.py", 0, "def a(): pass")], prune=True)
+
+    assert [i.split("#")[0] for i in stored_ids(embedder)] == ["a.py::chunk0"]
+
+
+def test_create_embeddings_keeps_records_not_passed(model):
+    embedder = embedding.Embedder("code_chunks_test")
+    embedder.create_embeddings([chunk("a.py", 0, "def a(): pass"), chunk("b.py", 0, "def b(): pass")])
+
+    embedder.create_embeddings([chunk("c.py", 0, "def c(): pass")])
+
+    assert [i.split("#")[0] for i in stored_ids(embedder)] == ["a.py::chunk0", "b.py::chunk0", "c.py::chunk0"]
+
+
+def test_faiss_index_follows_adds_and_removals(model):
+    pytest.importorskip("faiss")
+    embedder = embedding.Embedder("code_chunks_test")
+    embedder.stream_embed([chunk(f"f{i}.py", 0, f"def f{i}(): pass") for i in range(10)], prune=True)
+    assert embedder.index.ntotal == 10
+
+    embedder.stream_embed([chunk(f"f{i}.py", 0, f"def f{i}(): pass") for i in range(1, 10)]
+                          + [chunk("g.py", 0, "def g(): pass")], prune=True)
+    assert embedder.index.ntotal == embedder.collection.count() == 10
+
+    results = embedder.query("def g(): pass", top_k=1)
+    assert results["documents"] == [["def g(): pass"]]
+    assert results["distances"][0][0] == pytest.approx(0, abs=1e-5)
+    assert "def f0(): pass" not in embedder.query("def f0(): pass", top_k=10)["documents"][0]
+
+    # a fresh Embedder loads the saved index instead of starting empty
+    assert embedding.Embedder("code_chunks_test").index.ntotal == 10
+
+
+def test_faiss_index_is_rebuilt_when_out_of_step(model):
+    pytest.importorskip("faiss")
+    chunks = [chunk(f"f{i}.py", 0, f"def f{i}(): pass") for i in range(5)]
+    embedder = embedding.Embedder("code_chunks_test")
+    embedder.stream_embed(chunks, prune=True)
+    os.remove(os.path.join(embedder.index_dir, "index.faiss"))
+
+    model.encoded.clear()
+    embedder = embedding.Embedder("code_chunks_test")
+    assert embedder.index is None
+    embedder.stream_embed(chunks, prune=True)
+
+    assert model.encoded == []
+    assert embedder.index.ntotal == 5
+    assert embedder.query("def f3(): pass", top_k=1)["documents"] == [["def f3(): pass"]]
@@ -0,0 +1,52 @@
+import os
+
+from code_rag import ingestion
+
+
+def write(path, data=b"x = 1\n"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_get_code_files_skips_vendored_dirs_lockfiles_and_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "MAX_FILE_SIZE", 100)
+    write(tmp_path / "src" / "app.py")
+    write(tmp_path / "README.md")
+    write(tmp_path / "node_modules" / "lib" / "index.js")
+    write(tmp_path / ".git" / "config.toml")
+    write(tmp_path / "pkg" / "__pycache__" / "mod.py")
+    write(tmp_path / "package-lock.json", b"{}")
+    write(tmp_path / "notes.bin")
+    write(tmp_path / "big.py", b"#" * 101)
+    write(tmp_path / "edge.py", b"#" * 100)
+
+    files = ingestion.CodeIngestion(local_path=str(tmp_path)).get_code_files(str(tmp_path))
+
+    assert sorted(os.path.relpath(f, tmp_path) for f in files) == sorted(
+        ["README.md", "edge.py", os.path.join("src", "app.py")])
+
+
+def test_get_code_files_skips_missing_directory(tmp_path):
+    ingestor = ingestion.CodeIngestion(local_path=str(tmp_path))
+
+    assert list(ingestor.get_code_files(str(tmp_path / "missing"))) == []
+
+
+def test_read_files_skips_binary_content(tmp_path):
+    text = write(tmp_path / "a.py", b"print('hi')\n")
+    binary = write(tmp_path / "b.json", b"{\x00\x01}")
+    late_nul = write(tmp_path / "c.txt", b"a" * ingestion.BINARY_SNIFF_BYTES + b"\x00")
+
+    read = list(ingestion.CodeIngestion().read_files([str(text), str(binary), str(late_nul)]))
+
+    assert read == [(str(text), b"print('hi')\n"), (str(late_nul), late_nul.read_bytes())]
+
+
+def test_ingest_returns_paths_relative_to_repo_root(tmp_path):
+    write(tmp_path / "pkg" / "sub" / "mod.py", b"x = 1\n")
+    write(tmp_path / "top.py", b"y = 2\n")
+
+    files = ingestion.CodeIngestion(local_path=str(tmp_path)).ingest()
+
+    assert sorted(files) == [("pkg/sub/mod.py", b"x = 1\n"), ("top.py", b"y = 2\n")]